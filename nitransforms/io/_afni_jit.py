@@ -0,0 +1,35 @@
+"""Optionally JIT-compiled kernels for AFNI's bulk text codec."""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _fill_params(flat, out):
+    """
+    Scatter flattened AFNI parameter rows into homogeneous matrices.
+
+    Parameters
+    ----------
+    flat : (N, 12) numpy.ndarray
+        One row of twelve parameters per transform, as parsed from file.
+    out : (N, 4, 4) numpy.ndarray
+        Preallocated buffer receiving the homogeneous parameter matrices.
+
+    """
+    out[:, 3] = (0.0, 0.0, 0.0, 1.0)
+    out[:, :3] = flat.reshape((-1, 3, 4))
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _fill_params(flat, out):  # noqa: F811
+        for i in range(flat.shape[0]):
+            out[i, :3] = flat[i].reshape((3, 4))
+            out[i, 3, 0] = 0.0
+            out[i, 3, 1] = 0.0
+            out[i, 3, 2] = 0.0
+            out[i, 3, 3] = 1.0
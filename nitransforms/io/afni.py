@@ -1,11 +1,15 @@
 """Read/write AFNI's transforms."""
+from functools import lru_cache
+from io import BytesIO, StringIO
 from math import pi
+from xml.etree import ElementTree
 import numpy as np
 from nibabel.affines import (
     obliquity,
     voxel_sizes,
 )
 
+from ._afni_jit import _fill_params
 from .base import (
     BaseLinearTransformList,
     DisplacementsField,
@@ -15,6 +19,17 @@ from .base import (
 )
 
 LPS = np.diag([-1, -1, 1, 1])
+# Elementwise equivalent of ``LPS @ R @ LPS``: the diagonal of LPS flips the
+# signs of the rows/columns crossing the (0, 1) x (2, 3) blocks
+_LPS_SIGN = np.array(
+    [
+        [1, 1, -1, -1],
+        [1, 1, -1, -1],
+        [-1, -1, 1, 1],
+        [-1, -1, 1, 1],
+    ],
+    dtype="f8",
+)
 OBLIQUITY_THRESHOLD_DEG = 0.01
 
 
@@ -23,8 +38,8 @@ class AFNILinearTransform(LinearParameters):
 
     def __str__(self):
         """Generate a string representation."""
-        param = self.structarr["parameters"]
-        return "\t".join(["%g" % p for p in param[:3, :].reshape(-1)])
+        param = self.structarr["parameters"][:3, :].reshape(-1)
+        return "\t".join(np.char.mod("%g", param).tolist())
 
     def to_string(self, banner=True):
         """Convert to a string directly writeable to file."""
@@ -33,7 +48,7 @@ class AFNILinearTransform(LinearParameters):
             string = "\n".join(
                 ("# 3dvolreg matrices (DICOM-to-DICOM, row-by-row):", string)
             )
-        return string % self
+        return string
 
     @classmethod
     def from_ras(cls, ras, moving=None, reference=None):
@@ -63,8 +78,6 @@ class AFNILinearTransform(LinearParameters):
         >>> m_deobl == e_ras @ r_deobl
         >>> e_ras == inv(m_obl) @ ras @ r_obl
         """
-        # swapaxes is necessary, as axis 0 encodes series of transforms
-
         reference = _ensure_image(reference)
         if reference is not None and _is_oblique(reference.affine):
             ras = ras @ _cardinal_rotation(reference.affine, False)
@@ -73,11 +86,10 @@ class AFNILinearTransform(LinearParameters):
         if moving is not None and _is_oblique(moving.affine):
             ras = _cardinal_rotation(moving.affine, True) @ ras
 
-        # AFNI represents affine transformations as LPS-to-LPS
-        parameters = np.swapaxes(LPS @ ras @ LPS, 0, 1)
-
+        # AFNI represents affine transformations as LPS-to-LPS;
+        # the swapaxes-then-transpose of the stored parameters cancels out
         tf = cls()
-        tf.structarr["parameters"] = parameters.T
+        tf.structarr["parameters"] = ras * _LPS_SIGN
         return tf
 
     @classmethod
@@ -95,13 +107,14 @@ class AFNILinearTransform(LinearParameters):
         if not lines:
             raise TransformFileError
 
+        values = lines[0].split()
+        if len(values) != 12:
+            raise TransformFileError
+
+        parameters = np.empty((4, 4), dtype="f8")
+        parameters[3] = (0.0, 0.0, 0.0, 1.0)
         try:
-            parameters = np.vstack(
-                (
-                    np.genfromtxt([lines[0].encode()], dtype="f8").reshape((3, 4)),
-                    (0.0, 0.0, 0.0, 1.0),
-                )
-            )
+            parameters[:3] = np.fromiter(values, dtype="f8", count=12).reshape((3, 4))
         except ValueError as e:
             raise TransformFileError from e
 
@@ -110,8 +123,7 @@ class AFNILinearTransform(LinearParameters):
 
     def to_ras(self, moving=None, reference=None):
         """Return a nitransforms internal RAS+ matrix."""
-        # swapaxes is necessary, as axis 0 encodes series of transforms
-        retval = LPS @ np.swapaxes(self.structarr["parameters"].T, 0, 1) @ LPS
+        retval = self.structarr["parameters"] * _LPS_SIGN
         reference = _ensure_image(reference)
         if reference is not None and _is_oblique(reference.affine):
             retval = retval @ _cardinal_rotation(reference.affine, True)
@@ -137,22 +149,23 @@ class AFNILinearTransformArray(BaseLinearTransformList):
         if moving is not None and _is_oblique(mov_aff := _ensure_image(moving).affine):
             post_rotation = _cardinal_rotation(mov_aff, False)
 
-        return np.stack([
-            post_rotation @ (xfm.to_ras() @ pre_rotation)
-            for xfm in self.xforms
-        ])
+        # Collect all parameters and convert LPS -> RAS over the whole series
+        parameters = np.stack([xfm.structarr["parameters"] for xfm in self.xforms])
+        return post_rotation @ (parameters * _LPS_SIGN) @ pre_rotation
 
     def to_string(self):
         """Convert to a string directly writeable to file."""
-        strings = []
-        for i, xfm in enumerate(self.xforms):
-            lines = [
-                line.strip()
-                for line in xfm.to_string(banner=(i == 0)).splitlines()
-                if line.strip()
-            ]
-            strings += lines
-        return "\n".join(strings + [""])
+        if not self.xforms:
+            return ""
+
+        # Serialize the whole series in one np.savetxt pass
+        parameters = np.stack(
+            [xfm.structarr["parameters"][:3] for xfm in self.xforms]
+        ).reshape((len(self.xforms), 12))
+        buf = StringIO()
+        buf.write("# 3dvolreg matrices (DICOM-to-DICOM, row-by-row):\n")
+        np.savetxt(buf, parameters, fmt="%g", delimiter="\t")
+        return buf.getvalue()
 
     @classmethod
     def from_ras(cls, ras, moving=None, reference=None):
@@ -166,9 +179,10 @@ class AFNILinearTransformArray(BaseLinearTransformList):
         if moving is not None and _is_oblique(mov_aff := _ensure_image(moving).affine):
             post_rotation = _cardinal_rotation(mov_aff, True)
 
+        # Compose the rotations over the whole series with one broadcasted matmul
+        ras = post_rotation @ ras @ pre_rotation
         _self.xforms = [
-            cls._inner_type.from_ras(post_rotation @ ras[i, ...] @ pre_rotation)
-            for i in range(ras.shape[0])
+            cls._inner_type.from_ras(ras[i, ...]) for i in range(ras.shape[0])
         ]
         return _self
 
@@ -185,7 +199,20 @@ class AFNILinearTransformArray(BaseLinearTransformList):
         if not lines:
             raise TransformFileError("Input string is empty.")
 
-        _self.xforms = [cls._inner_type.from_string(line) for line in lines]
+        try:
+            arr = np.loadtxt(StringIO("\n".join(lines)), dtype="f8", ndmin=2)
+        except ValueError as e:
+            raise TransformFileError from e
+
+        if arr.shape[1] != 12:
+            raise TransformFileError
+
+        parameters = np.empty((arr.shape[0], 4, 4), dtype="f8")
+        _fill_params(arr, parameters)
+
+        _self.xforms = [cls._inner_type() for _ in range(arr.shape[0])]
+        for xfm, params in zip(_self.xforms, parameters):
+            xfm.structarr["parameters"] = params
         return _self
 
 
@@ -204,8 +231,13 @@ class AFNIDisplacementsField(DisplacementsField):
                 % imgobj.file_map["image"].filename
             )
 
-        field = np.squeeze(np.asanyarray(imgobj.dataobj))
-        field[..., (0, 1)] *= -1.0
+        # A single typed read off the (possibly memory-mapped) proxy, squeezed
+        # through reshape, touches the field's bytes only once
+        out_shape = tuple(s for s in shape if s != 1)
+        field = np.asarray(imgobj.dataobj, dtype="float32").reshape(out_shape)
+        # Basic slicing yields a view, so the sign flip is applied in place
+        # without the temporary that advanced indexing would materialize
+        field[..., :2] *= -1.0
 
         return imgobj.__class__(field, imgobj.affine, hdr)
 
@@ -226,7 +258,14 @@ def _is_oblique(affine, thres=OBLIQUITY_THRESHOLD_DEG):
     True
 
     """
-    return (obliquity(affine).max() * 180 / pi) > thres
+    return _is_oblique_cached(np.asarray(affine, dtype="f8").tobytes(), thres)
+
+
+@lru_cache(maxsize=128)
+def _is_oblique_cached(aff_bytes, thres):
+    """Compute obliquity off the affine's buffer, memoizing repeated queries."""
+    affine = np.frombuffer(aff_bytes).reshape((4, 4))
+    return bool((obliquity(affine).max() * 180 / pi) > thres)
 
 
 def _afni_deobliqued_grid(oblique, shape):
@@ -309,8 +348,10 @@ def _dicom_real_to_card(oblique):
     retval = np.eye(4)
     retval[:3, 3] = oblique[:3, 3]
 
-    # Calculate director cosines and project to closest canonical
-    cosines = oblique[:3, :3] / np.abs(oblique[:3, :3]).max(0)
+    # Calculate director cosines and project to closest canonical,
+    # reusing the |R| buffer for the quotient
+    cosines = np.abs(oblique[:3, :3])
+    np.divide(oblique[:3, :3], cosines.max(0), out=cosines)
     cosines[np.abs(cosines) < 1.0] = 0
     # Once director cosines are calculated, scale by voxel sizes
     retval[:3, :3] = np.round(voxel_sizes(oblique), decimals=4) * cosines
@@ -333,8 +374,11 @@ def _cardinal_rotation(oblique, real_to_card=True):
 
     """
     card = _dicom_real_to_card(oblique)
+    # A @ inv(B) solved as a linear system, avoiding the explicit inverse
     return (
-        card @ np.linalg.inv(oblique) if real_to_card else oblique @ np.linalg.inv(card)
+        np.linalg.solve(oblique.T, card.T).T
+        if real_to_card
+        else np.linalg.solve(card.T, oblique.T).T
     )
 
 
@@ -357,22 +401,46 @@ def _afni_warpdrive(oblique, forward=True):
         AFNI's *warpdrive* forward or inverse matrix.
 
     """
+    # For plumb affines the warpdrive reduces to the LPS flip (its own
+    # inverse): _dicom_real_to_card leaves the columns untouched while
+    # ijk_to_dicom_real flips columns 0-1, so R = diag(-1, -1, 1, 1)
+    if not _is_oblique(oblique):
+        return np.diag([-1.0, -1.0, 1.0, 1.0])
+
+    # Copy so that cached values cannot be mutated through the returned array
+    return _afni_warpdrive_cached(
+        np.asarray(oblique, dtype="f8").tobytes(), forward
+    ).copy()
+
+
+@lru_cache(maxsize=128)
+def _afni_warpdrive_cached(aff_bytes, forward):
+    """Compute the warpdrive matrix off the affine's buffer, memoizing results."""
+    oblique = np.frombuffer(aff_bytes).reshape((4, 4))
     ijk_to_dicom_real = np.diag(LPS) * oblique
     ijk_to_dicom = _dicom_real_to_card(oblique)
-    R = np.linalg.inv(ijk_to_dicom) @ ijk_to_dicom_real
-    return np.linalg.inv(R) if forward else R
+    # inv(A) @ B (and its inverse) solved as linear systems via one LU
+    # factorization each, instead of materializing explicit inverses
+    if forward:
+        return np.linalg.solve(ijk_to_dicom_real, ijk_to_dicom)
+    return np.linalg.solve(ijk_to_dicom, ijk_to_dicom_real)
 
 
 def _afni_header(nii, field="WARPDRIVE_MATVEC_FOR_000000", to_ras=False):
-    from lxml import etree
-
-    root = etree.fromstring(nii.header.extensions[0].get_content().decode())
-    retval = np.fromstring(
-        root.find(f".//*[@atr_name='{field}']").text, sep="\n", dtype="float32"
-    )
+    # Stream the extension incrementally and stop at the target attribute,
+    # instead of materializing the full XML tree
+    text = None
+    content = nii.header.extensions[0].get_content()
+    for _, elem in ElementTree.iterparse(BytesIO(content), events=("end",)):
+        if elem.get("atr_name") == field:
+            text = elem.text
+            break
+        elem.clear()
+
+    retval = np.fromiter(text.split(), dtype="float32")
     if retval.size == 12:
         retval = np.vstack((retval.reshape((3, 4)), (0, 0, 0, 1)))
         if to_ras:
-            retval = LPS @ retval @ LPS
+            retval = retval * _LPS_SIGN
 
     return retval